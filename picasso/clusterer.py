@@ -10,9 +10,8 @@
     :copyright: Copyright (c) 2022 Jungmann Lab, MPI of Biochemistry
 """
 
+import numba as _numba
 import numpy as _np
-import pandas as _pd
-from scipy.spatial import cKDTree as _cKDTree
 from scipy.spatial import ConvexHull as _ConvexHull
 from sklearn.cluster import DBSCAN as _DBSCAN
 
@@ -61,96 +60,348 @@ CLUSTER_CENTERS_DTYPE_3D = [
     ("group", "i4"),
 ]
 
-def _frame_analysis(frame, n_frames):
+
+def frame_analysis(labels, frame):
     """
-    Verifies which clusters pass basic frame analysis.
+    Performs basic frame analysis on clustered localizations.
 
     Rejects clusters whose mean frame is outside of the 
     [20, 80] % (max frame) range or any 1/20th of measurement's time
     contains more than 80 % of localizations.
 
-    Assumes frame to be a pandas.SeriesGruopBy object, grouped by
-    cluster ids.
+    All clusters are analyzed at once using np.bincount.
 
     Parameters
     ----------
-    frame : pandas.SeriesGruopBy
-        Frame number for a given cluster; grouped by cluster ids
-    n_frames : int
-        Acquisition time given in frames
+    labels : np.array
+        Cluster labels (-1 means no cluster assigned)
+    frame : np.array
+        Frame number for each localization
 
     Returns
     -------
-    int
-        1 if passed frame analysis, 0 otheriwse
+    np.array
+        Cluster labels for each localization (-1 means no cluster 
+        assigned)
     """
 
-    passed = 1
+    clustered = labels >= 0
+    if not clustered.any():
+        return labels
+    cluster_labels = labels[clustered]
+    cluster_frames = frame[clustered]
+    n_frames = frame.max() + 1 # acquisition time given in frames
+    n_clusters = cluster_labels.max() + 1
 
     # get mean frame
-    mean_frame = frame.values.mean()
-
-    # get maximum number of locs in a 1/20th of acquisition time
-    n_locs = len(frame)
-    locs_binned = _np.histogram(
-        frame.values, bins=_np.linspace(0, n_frames, 21)
-    )[0]
-    max_locs_bin = locs_binned.max()
+    n_locs = _np.bincount(cluster_labels, minlength=n_clusters)
+    mean_frame = _np.bincount(
+        cluster_labels, weights=cluster_frames, minlength=n_clusters
+    ) / _np.maximum(n_locs, 1)
+
+    # get maximum number of locs in a 1/20th of acquisition time; bins
+    # are the same as in np.histogram(frame, np.linspace(0, n_frames, 21))
+    bin_edges = _np.linspace(0, n_frames, 21)
+    bins = _np.searchsorted(bin_edges, cluster_frames, side="right") - 1
+    locs_binned = _np.bincount(
+        cluster_labels * 20 + bins, minlength=n_clusters * 20
+    ).reshape(n_clusters, 20)
+    max_locs_bin = locs_binned.max(axis=1)
 
     # test if frame analysis passed
-    if (
-        (mean_frame < 0.2 * n_frames)
-        or (mean_frame > 0.8 * n_frames)
-        or (max_locs_bin > 0.8 * n_locs)
-    ):
-        passed = 0
+    passed = (
+        (mean_frame >= 0.2 * n_frames)
+        & (mean_frame <= 0.8 * n_frames)
+        & (max_locs_bin <= 0.8 * n_locs)
+    )
 
-    return passed
+    # change labels of clusters that did not pass frame analysis to -1
+    labels[clustered] = _np.where(
+        passed[cluster_labels], cluster_labels, -1
+    )
 
+    return labels
 
-def frame_analysis(labels, frame):
+
+def _radius_neighbors(X, radius):
     """
-    Performs basic frame analysis on clustered localizations.
+    Finds neighbors of each point within radius.
+
+    Points are searched on a uniform grid by kernels specialized for 2D
+    and 3D. The result is given in the compressed sparse row (CSR)
+    format.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of points of shape (n_points, 2) or (n_points, 3)
+    radius : float
+        Search radius
+
+    Returns
+    -------
+    indptr : np.array
+        Index pointers of shape (n_points + 1,), such that the 
+        neighbors of point i are indices[indptr[i]:indptr[i+1]]
+    indices : np.array
+        Indeces of the neighbors of all points, concatenated. Each 
+        point is its own neighbor
+    """
+
+    if radius <= 0:
+        raise ValueError("Clustering radius must be positive.")
+    if X.shape[0] == 0: # no points, no neighbors
+        indptr = _np.zeros(1, dtype=_np.int64)
+        return indptr, _np.empty(0, dtype=_np.int32)
+    if X.shape[1] == 2:
+        return _grid_neighbors_2d(X, radius)
+    elif X.shape[1] == 3:
+        return _grid_neighbors_3d(X, radius)
+    else:
+        raise ValueError("Only 2D and 3D points can be clustered.")
 
-    Rejects clusters whose mean frame is outside of the 
-    [20, 80] % (max frame) range or any 1/20th of measurement's time
-    contains more than 80 % of localizations.
 
-    Uses pandas for fast calculations using groupby().
+@_numba.njit(parallel=True, cache=True)
+def _grid_neighbors_2d(X, radius):
+    """
+    Finds neighbors of each 2D point within radius on a uniform grid
+    with cell size radius. Only the 3x3 cells around each point are
+    searched.
+
+    Points are sorted by their cell keys, so the 3 cells that are
+    adjacent in y hold a contiguous run of points which is found with
+    a single binary search. Neighbors are counted in a first pass and
+    saved in a second one; both run in parallel across points.
 
     Parameters
     ----------
-    labels : np.array
-        Cluster labels (-1 means no cluster assigned)
-    frame : np.array
-        Frame number for each localization
+    X : np.array
+        Array of points of shape (n_points, 2)
+    radius : float
+        Search radius
+
+    Returns
+    -------
+    indptr : np.array
+        Index pointers of shape (n_points + 1,), such that the 
+        neighbors of point i are indices[indptr[i]:indptr[i+1]]
+    indices : np.array
+        Indeces of the neighbors of all points, concatenated
+    """
+
+    n = X.shape[0]
+    r2 = radius ** 2
+    # cells are slightly larger than radius so that no neighbor is 
+    # missed due to rounding
+    cell_size = radius * (1 + 1e-6)
+    cx = ((X[:, 0] - X[:, 0].min()) / cell_size).astype(_np.int64)
+    cy = ((X[:, 1] - X[:, 1].min()) / cell_size).astype(_np.int64)
+    nx = cx.max() + 1
+    ny = cy.max() + 1
+    keys = cx * ny + cy
+    order = _np.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+    x = X[order, 0] # sorted coordinates for contiguous access
+    y = X[order, 1]
+
+    counts = _np.zeros(n, dtype=_np.int64)
+    indptr = _np.zeros(n + 1, dtype=_np.int64)
+    indices = _np.empty(0, dtype=_np.int32)
+    for step in range(2): # 0 - count neighbors, 1 - save them
+        if step == 1:
+            indptr[1:] = _np.cumsum(counts)
+            indices = _np.empty(indptr[-1], dtype=_np.int32)
+        for i in _numba.prange(n):
+            k = indptr[i]
+            y_min = max(cy[i] - 1, 0)
+            y_max = min(cy[i] + 1, ny - 1)
+            for x_cell in range(max(cx[i] - 1, 0), min(cx[i] + 2, nx)):
+                start = _np.searchsorted(sorted_keys, x_cell * ny + y_min)
+                stop = _np.searchsorted(
+                    sorted_keys, x_cell * ny + y_max, side="right"
+                )
+                for m in range(start, stop):
+                    d2 = (x[m] - X[i, 0]) ** 2 + (y[m] - X[i, 1]) ** 2
+                    if d2 <= r2:
+                        if step == 0:
+                            counts[i] += 1
+                        else:
+                            indices[k] = order[m]
+                            k += 1
+    return indptr, indices
+
+
+@_numba.njit(parallel=True, cache=True)
+def _grid_neighbors_3d(X, radius):
+    """
+    Finds neighbors of each 3D point within radius on a uniform grid
+    with cell size radius. Only the 3x3x3 cells around each point are
+    searched.
+
+    Points are sorted by their cell keys, so the 3 cells that are
+    adjacent in z hold a contiguous run of points which is found with
+    a single binary search. Neighbors are counted in a first pass and
+    saved in a second one; both run in parallel across points.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of points of shape (n_points, 3)
+    radius : float
+        Search radius
+
+    Returns
+    -------
+    indptr : np.array
+        Index pointers of shape (n_points + 1,), such that the 
+        neighbors of point i are indices[indptr[i]:indptr[i+1]]
+    indices : np.array
+        Indeces of the neighbors of all points, concatenated
+    """
+
+    n = X.shape[0]
+    r2 = radius ** 2
+    # cells are slightly larger than radius so that no neighbor is 
+    # missed due to rounding
+    cell_size = radius * (1 + 1e-6)
+    cx = ((X[:, 0] - X[:, 0].min()) / cell_size).astype(_np.int64)
+    cy = ((X[:, 1] - X[:, 1].min()) / cell_size).astype(_np.int64)
+    cz = ((X[:, 2] - X[:, 2].min()) / cell_size).astype(_np.int64)
+    nx = cx.max() + 1
+    ny = cy.max() + 1
+    nz = cz.max() + 1
+    keys = (cx * ny + cy) * nz + cz
+    order = _np.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+    x = X[order, 0] # sorted coordinates for contiguous access
+    y = X[order, 1]
+    z = X[order, 2]
+
+    counts = _np.zeros(n, dtype=_np.int64)
+    indptr = _np.zeros(n + 1, dtype=_np.int64)
+    indices = _np.empty(0, dtype=_np.int32)
+    for step in range(2): # 0 - count neighbors, 1 - save them
+        if step == 1:
+            indptr[1:] = _np.cumsum(counts)
+            indices = _np.empty(indptr[-1], dtype=_np.int32)
+        for i in _numba.prange(n):
+            k = indptr[i]
+            z_min = max(cz[i] - 1, 0)
+            z_max = min(cz[i] + 1, nz - 1)
+            for x_cell in range(max(cx[i] - 1, 0), min(cx[i] + 2, nx)):
+                for y_cell in range(max(cy[i] - 1, 0), min(cy[i] + 2, ny)):
+                    row = (x_cell * ny + y_cell) * nz
+                    start = _np.searchsorted(sorted_keys, row + z_min)
+                    stop = _np.searchsorted(
+                        sorted_keys, row + z_max, side="right"
+                    )
+                    for m in range(start, stop):
+                        d2 = (
+                            (x[m] - X[i, 0]) ** 2
+                            + (y[m] - X[i, 1]) ** 2
+                            + (z[m] - X[i, 2]) ** 2
+                        )
+                        if d2 <= r2:
+                            if step == 0:
+                                counts[i] += 1
+                            else:
+                                indices[k] = order[m]
+                                k += 1
+    return indptr, indices
+
+
+@_numba.njit(parallel=True, cache=True)
+def _local_maxima(indptr, indices, min_locs):
+    """
+    Finds local maxima, i.e., points with more than min_locs neighbors
+    which have the most neighbors within their neighborhood.
+
+    Points are processed in parallel.
+
+    Parameters
+    ----------
+    indptr : np.array
+        Index pointers of the neighbors of each point, such that the
+        neighbors of point i are indices[indptr[i]:indptr[i+1]]
+    indices : np.array
+        Indeces of the neighbors of all points, concatenated
+    min_locs : int
+        Minimum number of localizations in a cluster
 
     Returns
     -------
     np.array
-        Cluster labels for each localization (-1 means no cluster 
-        assigned)
+        True for each point that is a local maximum
     """
 
-    # group frames by cluster ids
-    frame_pd = _pd.Series(frame, index=labels)
-    frame_grouped = frame_pd.groupby(frame_pd.index)
+    n = indptr.shape[0] - 1
+    counts = indptr[1:] - indptr[:-1] # number of neighbors of each point
+    lm = _np.zeros(n, dtype=_np.bool_)
+    for i in _numba.prange(n):
+        n_i = counts[i] # note that i is included in its neighbors
+        if n_i > min_locs:
+            n_max = 0
+            for k in range(indptr[i], indptr[i+1]):
+                n_max = max(n_max, counts[indices[k]])
+            if n_i == n_max:
+                lm[i] = True
+    return lm
+
+
+@_numba.njit(cache=True)
+def _assign_labels(indptr, indices, lm):
+    """
+    Assigns cluster labels to all points, given local maxima.
 
-    # perform frame analysis
-    true_cluster = frame_grouped.apply(_frame_analysis, frame.max()+1)
+    Local maxima are visited in order. A local maximum that was not
+    assigned yet starts a new cluster with all of its neighbors. If a
+    local maximum was already assigned to a cluster (i.e., two local
+    maxima are within radius from each other), its unassigned
+    neighbors are added to that cluster.
 
-    # cluster ids that did not pass frame analysis
-    discard = true_cluster.index[true_cluster == 0].values
-    # change labels of these clusters to -1
-    labels[_np.isin(labels, discard)] = -1
+    Note that this is not a connected components search; clusters that
+    only share neighbors are not merged, which would otherwise chain
+    nearby clusters together.
 
+    Parameters
+    ----------
+    indptr : np.array
+        Index pointers of the neighbors of each point, such that the
+        neighbors of point i are indices[indptr[i]:indptr[i+1]]
+    indices : np.array
+        Indeces of the neighbors of all points, concatenated
+    lm : np.array
+        True for each point that is a local maximum
+
+    Returns
+    -------
+    np.array
+        Cluster labels for each point (-1 means no cluster assigned)
+    """
+
+    n = indptr.shape[0] - 1
+    labels = -_np.ones(n, dtype=_np.int32)
+    count = 0
+    for i in range(n):
+        if lm[i]:
+            label = labels[i]
+            if label == -1: # if lm not assigned yet
+                for k in range(indptr[i], indptr[i+1]):
+                    labels[indices[k]] = count
+            else: # assign unassigned neighbors to the lm's cluster
+                for k in range(indptr[i], indptr[i+1]):
+                    j = indices[k]
+                    if labels[j] == -1:
+                        labels[j] = label
+            count += 1
     return labels
 
 
 def _cluster(X, radius, min_locs, frame=None):
     """
     Clusters points given by X with a given clustering radius and 
-    minimum number of localizaitons withing that radius using KDTree
+    minimum number of localizaitons withing that radius using a uniform
+    grid
 
     Parameters
     ----------
@@ -171,48 +422,23 @@ def _cluster(X, radius, min_locs, frame=None):
         assigned)
     """
 
-    ## build kdtree (use cKDTree in case user did not update scipy)
-    tree = _cKDTree(X)
-
-    ## find neighbors for each point within radius
-    neighbors = tree.query_ball_tree(tree, radius)
+    ## find neighbors of each point within radius
+    indptr, indices = _radius_neighbors(X, radius)
 
     ## find local maxima, i.e., points with the most neighbors within
     ## their neighborhood
-    lm = _np.zeros(X.shape[0], dtype=_np.int8)
-    for i in range(len(lm)):
-        idx = neighbors[i] # indeces of points that are neighbors of i
-        n = len(idx) # number of neighbors of i
-        if n > min_locs: # note that i is included in its neighbors
-            # if i has the most neighbors in its neighborhood
-            if n == max([len(neighbors[_]) for _ in idx]):
-                lm[i] = 1
+    lm = _local_maxima(indptr, indices, min_locs)
 
     ## assign cluster labels to all points (-1 means no cluster)
-    ## if two local maxima are within radius from each other, combine
-    ## such clusters
-    labels = -1 * _np.ones(X.shape[0], dtype=_np.int32) # cluster labels
-    lm_idx = _np.where(lm == 1)[0] # indeces of local maxima
-
-    for count, i in enumerate(lm_idx): # for each local maximum
-        label = labels[i]
-        if label == -1: # if lm not assigned yet
-            labels[neighbors[i]] = count
-        else:
-            # indeces of locs that were not assigned to any cluster
-            idx = [
-                neighbors[i][_]
-                for _ in _np.where(labels[neighbors[i]] == -1)[0]
-            ]
-            if len(idx): # if such a loc exists, assign it to a cluster
-                labels[idx] = label
+    labels = _assign_labels(indptr, indices, lm)
 
     ## check for number of locs per cluster to be above min_locs
-    values, counts = _np.unique(labels, return_counts=True)
-    # labels to discard if has fewer locs than min_locs
-    to_discard = values[counts < min_locs]
-    # substitute this with -1
-    labels[_np.isin(labels, to_discard)] = -1
+    clustered = labels >= 0
+    n_locs = _np.bincount(labels[clustered]) # n_locs in each cluster
+    # substitute labels of clusters with fewer locs than min_locs with -1
+    labels[clustered] = _np.where(
+        n_locs[labels[clustered]] >= min_locs, labels[clustered], -1
+    )
 
     if frame is not None:
         labels = frame_analysis(labels, frame)
@@ -246,7 +472,11 @@ def cluster_2D(x, y, frame, radius, min_locs, fa):
         assigned)
     """
 
-    X = _np.stack((x, y)).T
+    # distances are compared to radius in float64 so that points
+    # exactly at radius are neighbors as before, e.g., on a grid
+    X = _np.empty((len(x), 2), dtype=_np.float64)
+    X[:, 0] = x
+    X[:, 1] = y
 
     if not fa:
         frame = None
@@ -289,7 +519,12 @@ def cluster_3D(x, y, z, frame, radius_xy, radius_z, min_locs, fa):
     """
 
     radius = radius_xy
-    X = _np.stack((x, y, z * radius_xy / radius_z)).T
+    # distances are compared to radius in float64 so that points
+    # exactly at radius are neighbors as before, e.g., on a grid
+    X = _np.empty((len(x), 3), dtype=_np.float64)
+    X[:, 0] = x
+    X[:, 1] = y
+    _np.multiply(z, radius_xy / radius_z, out=X[:, 2])
 
     if not fa:
         frame = None
@@ -301,7 +536,7 @@ def cluster_3D(x, y, z, frame, radius_xy, radius_z, min_locs, fa):
 
 def cluster(locs, params, pixelsize=None):
     """
-    Clusters localizations given user parameters using KDTree.
+    Clusters localizations given user parameters using a uniform grid.
 
     Finds if localizations are 2D or 3D.
 
@@ -531,7 +766,8 @@ def error_sums_wtd(x, w):
     x : float
         x or y coordinate of the cluster center
     w : float
-        weight (inverse localization precision squared)
+        weight (cluster centers use localization precision, lpx or 
+        lpy)
 
     Returns
     -------
@@ -546,7 +782,9 @@ def find_cluster_centers(locs, pixelsize=None):
     """
     Calculates cluster centers. 
 
-    Uses pandas.groupby to quickly run across all cluster ids.
+    Localizations are sorted by cluster id (group) and all attributes
+    apart from convex hulls are found with numba reductions over the
+    clusters' slices, run in parallel across clusters.
 
     Parameters
     ----------
@@ -562,95 +800,290 @@ def find_cluster_centers(locs, pixelsize=None):
         Cluster centers saved as localizations
     """
 
-    # group locs by their cluster id (group)
-    locs_pd = _pd.DataFrame(locs)
-    grouplocs = locs_pd.groupby(locs_pd.group)
-
-    # get cluster centers
-    res = grouplocs.apply(cluster_center, pixelsize)
-    centers_ = res.values
-
-    # convert to recarray and save
-    frame = _np.array([_[0] for _ in centers_])
-    std_frame = _np.array([_[1] for _ in centers_])
-    x = _np.array([_[2] for _ in centers_])
-    y = _np.array([_[3] for _ in centers_])
-    std_x = _np.array([_[4] for _ in centers_])
-    std_y = _np.array([_[5] for _ in centers_])
-    photons = _np.array([_[6] for _ in centers_])
-    sx = _np.array([_[7] for _ in centers_])
-    sy = _np.array([_[8] for _ in centers_])
-    bg = _np.array([_[9] for _ in centers_])
-    lpx = _np.array([_[10] for _ in centers_])
-    lpy = _np.array([_[11] for _ in centers_])
-    ellipticity = _np.array([_[12] for _ in centers_])
-    net_gradient = _np.array([_[13] for _ in centers_])
-    n = _np.array([_[14] for _ in centers_])
-
-    if hasattr(locs, "z"):
-        z = _np.array([_[15] for _ in centers_])
-        std_z = _np.array([_[16] for _ in centers_])
-        volume = _np.array([_[17] for _ in centers_])
-        convexhull = _np.array([_[18] for _ in centers_])
-        centers = _np.rec.array(
-            (
-                frame,
-                std_frame,
-                x,
-                y,
-                std_x,
-                std_y,
-                z,
-                photons,
-                sx,
-                sy,
-                bg,
-                lpx,
-                lpy,
-                std_z,
-                ellipticity,
-                net_gradient,
-                n,
-                volume,
-                convexhull,
-                res.index.values, # group id
-            ),
-            dtype=CLUSTER_CENTERS_DTYPE_3D,
+    is_3d = "z" in locs.dtype.names
+    has_group_input = "group_input" in locs.dtype.names
+    if is_3d and pixelsize is None:
+        raise ValueError(
+            "Camera pixel size must be specified as an integer for 3D"
+            " cluster centers calculation."
         )
+    if is_3d:
+        dtype = CLUSTER_CENTERS_DTYPE_3D
     else:
-        area = _np.array([_[15] for _ in centers_])
-        convexhull = _np.array([_[16] for _ in centers_])
-        centers = _np.rec.array(
-            (
-                frame,
-                std_frame,
-                x,
-                y,
-                std_x,
-                std_y,
-                photons,
-                sx,
-                sy,
-                bg,
-                lpx,
-                lpy,
-                ellipticity,
-                net_gradient,
-                n,
-                area,
-                convexhull,
-                res.index.values, # group id
-            ),
-            dtype=CLUSTER_CENTERS_DTYPE_2D,
+        dtype = CLUSTER_CENTERS_DTYPE_2D
+    if has_group_input:
+        dtype = dtype + [("group_input", locs.dtype["group_input"])]
+    if len(locs) == 0:
+        return _np.recarray(0, dtype=dtype)
+
+    # look up the needed columns once as plain arrays
+    columns = ["frame", "x", "y", "photons", "sx", "sy", "bg", "net_gradient"]
+    if is_3d:
+        columns.append("z")
+    other_columns = ["group", "lpx", "lpy"]
+    if has_group_input:
+        other_columns.append("group_input")
+    cols = {_: locs[_].view(_np.ndarray) for _ in columns + other_columns}
+
+    # sort locs by their cluster id (group) and find the first loc of
+    # each cluster
+    order = _sort_by_group(cols["group"])
+    group = cols["group"][order]
+    starts = _np.concatenate(
+        ([0], _np.flatnonzero(_np.diff(group)) + 1, [len(group)])
+    )
+    n = _np.diff(starts) # n_locs in cluster
+    # attributes are kept in single precision to halve memory traffic;
+    # the reductions accumulate in double precision
+    values = _np.stack([cols[_][order] for _ in columns], dtype=_np.float32)
+    x = values[1]
+    y = values[2]
+    lpx = cols["lpx"][order].astype(_np.float32, copy=False)
+    lpy = cols["lpy"][order].astype(_np.float32, copy=False)
+
+    # mean and std of each attribute
+    means, stds = _group_mean_std(values, starts)
+    frame_mean, _, _, photons, sx, sy, bg, net_gradient = means[:8]
+    std_frame, std_x, std_y = stds[:3]
+    # inverse-variance weights, found once for all localizations
+    w_x = 1 / lpx ** 2
+    w_y = 1 / lpy ** 2
+    # average x and y, weighted by lpx, lpy
+    x_mean, _ = _group_weighted_stats(x, w_x, starts)
+    y_mean, _ = _group_weighted_stats(y, w_y, starts)
+    # weighted mean loc precision
+    _, err_x = _group_weighted_stats(x, lpx, starts)
+    _, err_y = _group_weighted_stats(y, lpy, starts)
+    # take the mean of the two for lpx and lpy
+    lp = 0.5 * (_np.sqrt(err_x / (n - 1)) + _np.sqrt(err_y / (n - 1)))
+    # other attributes
+    ellipticity = sx / sy
+
+    # allocate the recarray once and fill it column by column
+    centers = _np.recarray(len(n), dtype=dtype)
+    centers.frame = frame_mean
+    centers.std_frame = std_frame
+    centers.x = x_mean
+    centers.y = y_mean
+    centers.std_x = std_x
+    centers.std_y = std_y
+    centers.photons = photons
+    centers.sx = sx
+    centers.sy = sy
+    centers.bg = bg
+    centers.lpx = lp
+    centers.lpy = lp
+    centers.ellipticity = ellipticity
+    centers.net_gradient = net_gradient
+    centers.n = n
+    centers.group = group[starts[:-1]]
+
+    if is_3d:
+        z = values[8]
+        # take lpz = 2 * mean(lpx, lpy)
+        centers.z, _ = _group_weighted_stats(
+            z, 1 / (lpx + lpy) ** 2, starts
         )
+        centers.std_z = stds[8]
+        centers.volume = _np.power(
+            (std_x + std_y + stds[8] / pixelsize) / 3 * 2, 3
+        ) * 4.18879
+        centers.convexhull = _convex_hulls(
+            _np.stack((x, y, z / pixelsize)).T, starts
+        )
+    else:
+        centers.area = _np.power(std_x + std_y, 2) * _np.pi
+        centers.convexhull = _convex_hulls(_np.stack((x, y)).T, starts)
 
-    if hasattr(locs, "group_input"):
-        group_input = _np.array([_[-1] for _ in centers_])
-        centers = _lib.append_to_rec(centers, group_input, "group_input")
+    if has_group_input:
+        # assumes only one group input per cluster!
+        centers.group_input = _np.minimum.reduceat(
+            cols["group_input"][order], starts[:-1]
+        )
 
     return centers
 
 
+def _sort_by_group(group):
+    """
+    Finds the indeces that sort localizations by their cluster id
+    (group), keeping the original order within each cluster.
+
+    Cluster ids are usually dense non-negative integers, in which case
+    a counting sort is used instead of a comparison sort.
+
+    Parameters
+    ----------
+    group : np.array
+        Cluster id of each localization
+
+    Returns
+    -------
+    np.array
+        Indeces that stably sort group
+    """
+
+    if (
+        len(group)
+        and group.min() >= 0
+        and group.max() < 10 * len(group) # limit memory of bincount
+    ):
+        return _counting_sort(group, _np.bincount(group))
+    return _np.argsort(group, kind="stable")
+
+
+@_numba.njit(cache=True)
+def _counting_sort(group, counts):
+    """
+    Stably sorts non-negative cluster ids using their counts.
+
+    Parameters
+    ----------
+    group : np.array
+        Cluster id of each localization
+    counts : np.array
+        Number of localizations with each cluster id
+
+    Returns
+    -------
+    np.array
+        Indeces that stably sort group
+    """
+
+    position = _np.zeros(len(counts), dtype=_np.int64)
+    position[1:] = _np.cumsum(counts)[:-1]
+    order = _np.empty(len(group), dtype=_np.int64)
+    for i in range(len(group)):
+        order[position[group[i]]] = i
+        position[group[i]] += 1
+    return order
+
+
+@_numba.njit(parallel=True, cache=True)
+def _group_mean_std(values, starts):
+    """
+    Finds the mean and standard deviation (with 1 degree of freedom)
+    of values in each cluster.
+
+    Clusters are processed in parallel.
+
+    Parameters
+    ----------
+    values : np.array
+        Array of shape (n_attributes, n_points) sorted by cluster id
+    starts : np.array
+        Index of the first point of each cluster, followed by n_points
+
+    Returns
+    -------
+    mean : np.array
+        Mean of each attribute and cluster, shape 
+        (n_attributes, n_clusters)
+    std : np.array
+        Standard deviation of each attribute and cluster; NaN for 
+        clusters with a single point
+    """
+
+    n_attributes = values.shape[0]
+    n_clusters = starts.shape[0] - 1
+    mean = _np.empty((n_attributes, n_clusters), dtype=_np.float32)
+    std = _np.empty((n_attributes, n_clusters), dtype=_np.float32)
+    for i in _numba.prange(n_clusters):
+        start = starts[i]
+        stop = starts[i+1]
+        n = stop - start
+        for j in range(n_attributes):
+            total = 0.0
+            for k in range(start, stop):
+                total += values[j, k]
+            m = total / n
+            mean[j, i] = m
+            if n > 1:
+                sq_sum = 0.0
+                for k in range(start, stop):
+                    sq_sum += (values[j, k] - m) ** 2
+                std[j, i] = _np.sqrt(sq_sum / (n - 1))
+            else:
+                std[j, i] = _np.nan
+    return mean, std
+
+
+@_numba.njit(parallel=True, cache=True)
+def _group_weighted_stats(values, weights, starts):
+    """
+    Finds the weighted average and the weighted error sums (see 
+    error_sums_wtd) of values in each cluster.
+
+    Clusters are processed in parallel.
+
+    Parameters
+    ----------
+    values : np.array
+        Values sorted by cluster id
+    weights : np.array
+        Weight of each value
+    starts : np.array
+        Index of the first value of each cluster, followed by the
+        number of values
+
+    Returns
+    -------
+    average : np.array
+        Weighted average of each cluster
+    error_sums : np.array
+        Weighted error sums of each cluster; NaN for clusters with a
+        single value
+    """
+
+    n_clusters = starts.shape[0] - 1
+    average = _np.empty(n_clusters, dtype=_np.float32)
+    error_sums = _np.empty(n_clusters, dtype=_np.float32)
+    for i in _numba.prange(n_clusters):
+        w_sum = 0.0
+        wx_sum = 0.0
+        for k in range(starts[i], starts[i+1]):
+            w_sum += weights[k]
+            wx_sum += weights[k] * values[k]
+        m = wx_sum / w_sum
+        average[i] = m
+        if starts[i+1] - starts[i] > 1:
+            err_sum = 0.0
+            for k in range(starts[i], starts[i+1]):
+                err_sum += weights[k] * (values[k] - m) ** 2
+            error_sums[i] = err_sum / w_sum
+        else:
+            error_sums[i] = _np.nan
+    return average, error_sums
+
+
+def _convex_hulls(X, starts):
+    """
+    Finds the convex hull volume (area in 2D) of each cluster.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of points of shape (n_points, n_dim), sorted by cluster
+        id
+    starts : np.array
+        Index of the first point of each cluster, followed by n_points
+
+    Returns
+    -------
+    np.array
+        Convex hull volume of each cluster. 0 if the convex hull could
+        not be found (e.g., too few points)
+    """
+
+    convexhull = _np.zeros(len(starts) - 1, dtype=_np.float32)
+    for i, points in enumerate(_np.split(X, starts[1:-1])):
+        try:
+            convexhull[i] = _ConvexHull(points).volume
+        except Exception:
+            convexhull[i] = 0
+    return convexhull
+
+
 def cluster_center(grouplocs, pixelsize=None, separate_lp=False):
     """
     Finds cluster centers and their attributes.
@@ -0,0 +1,270 @@
+"""
+Tests of the SMLM clusterer and cluster centers.
+"""
+
+import warnings
+
+import numpy as np
+import pytest
+
+from picasso import clusterer
+
+
+def _clustered_locs(group, three_d=False, group_input=False):
+    """
+    Creates clustered localizations with random attributes, given the
+    cluster id of each localization.
+    """
+
+    rng = np.random.default_rng(0)
+    dtype = [("frame", "u4"), ("x", "f4"), ("y", "f4")]
+    if three_d:
+        dtype.append(("z", "f4"))
+    dtype += [
+        ("photons", "f4"),
+        ("sx", "f4"),
+        ("sy", "f4"),
+        ("bg", "f4"),
+        ("lpx", "f4"),
+        ("lpy", "f4"),
+        ("ellipticity", "f4"),
+        ("net_gradient", "f4"),
+        ("group", "i4"),
+    ]
+    if group_input:
+        dtype.append(("group_input", "i4"))
+    locs = np.rec.array(np.zeros(len(group), dtype=dtype))
+    for name in locs.dtype.names:
+        locs[name] = rng.uniform(1, 100, len(group))
+    locs.lpx = rng.uniform(0.01, 0.1, len(group))
+    locs.lpy = rng.uniform(0.01, 0.1, len(group))
+    locs.group = group
+    if group_input:
+        locs.group_input = 10 * np.asarray(group)
+    return locs
+
+
+def _locs(x, y, z=None, frame=None):
+    """
+    Creates localizations at given coordinates for clustering.
+    """
+
+    dtype = [("frame", "u4"), ("x", "f4"), ("y", "f4")]
+    if z is not None:
+        dtype.append(("z", "f4"))
+    locs = np.rec.array(np.zeros(len(x), dtype=dtype))
+    locs.x = x
+    locs.y = y
+    if z is not None:
+        locs.z = z
+    if frame is not None:
+        locs.frame = frame
+    return locs
+
+
+def test_cluster_empty():
+    """
+    Test that no localizations give no clustered localizations
+    """
+
+    locs = _locs([], [])
+    assert len(clusterer.cluster(locs, (0.1, 3, None, True, None))) == 0
+    locs = _locs([], [], z=[])
+    assert len(
+        clusterer.cluster(locs, (0.1, 0.3, 3, None, True, None), 130)
+    ) == 0
+
+
+def test_radius_neighbors_nonpositive_radius():
+    """
+    Test that a clustering radius of zero is rejected
+    """
+
+    X = np.zeros((3, 2))
+    with pytest.raises(ValueError):
+        clusterer._radius_neighbors(X, 0)
+
+
+def test_find_cluster_centers_empty():
+    """
+    Test that no localizations give no cluster centers
+    """
+
+    for three_d in [False, True]:
+        locs = _clustered_locs([], three_d=three_d)
+        centers = clusterer.find_cluster_centers(locs, pixelsize=130)
+        assert len(centers) == 0
+        if three_d:
+            assert centers.dtype == np.dtype(
+                clusterer.CLUSTER_CENTERS_DTYPE_3D
+            )
+        else:
+            assert centers.dtype == np.dtype(
+                clusterer.CLUSTER_CENTERS_DTYPE_2D
+            )
+
+
+def test_find_cluster_centers_single_loc():
+    """
+    Test that single localization clusters get NaN localization
+    precision without warnings
+    """
+
+    locs = _clustered_locs([0, 1, 1, 1, 2])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        centers = clusterer.find_cluster_centers(locs)
+    assert list(centers.n) == [1, 3, 1]
+    assert np.isnan(centers.lpx[[0, 2]]).all()
+    assert np.isnan(centers.lpy[[0, 2]]).all()
+    assert np.isfinite(centers.lpx[1])
+    assert centers.x[0] == locs.x[0]
+
+
+def test_find_cluster_centers_group_input():
+    """
+    Test that group input of each cluster is kept
+    """
+
+    locs = _clustered_locs([3, 3, 5, 5, 5, 8], group_input=True)
+    centers = clusterer.find_cluster_centers(locs)
+    assert list(centers.group) == [3, 5, 8]
+    assert list(centers.group_input) == [30, 50, 80]
+    assert list(centers.n) == [2, 3, 1]
+
+
+def test_radius_neighbors():
+    """
+    Test neighbors found on the grid against KDTree, including points
+    exactly at radius from each other
+    """
+
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(0)
+    # random points and integer and 0.1-spaced grids (ties at radius)
+    grid_2d = np.stack(np.meshgrid(np.arange(10), np.arange(10)), -1)
+    grid_3d = np.stack(np.meshgrid(*[np.arange(5)] * 3), -1)
+    cases = [
+        (rng.uniform(0, 10, (2000, 2)), 0.3),
+        (rng.uniform(0, 10, (2000, 3)), 0.5),
+        (grid_2d.reshape(-1, 2).astype(np.float64), 1.0),
+        (grid_3d.reshape(-1, 3).astype(np.float64), 1.0),
+        (0.1 * grid_2d.reshape(-1, 2).astype(np.float64), 0.1),
+        (0.1 * grid_3d.reshape(-1, 3).astype(np.float64), 0.1),
+    ]
+    for X, radius in cases:
+        indptr, indices = clusterer._radius_neighbors(X, radius)
+        expected = cKDTree(X).query_ball_point(X, radius)
+        assert len(indptr) == len(X) + 1
+        for i in range(len(X)):
+            neighbors = indices[indptr[i]:indptr[i+1]]
+            assert sorted(neighbors) == sorted(expected[i])
+
+
+def test_frame_analysis():
+    """
+    Test that frame analysis rejects clusters with a mean frame
+    outside of [20, 80] % of acquisition time or with most
+    localizations in one 1/20th of it
+    """
+
+    frame = np.concatenate((
+        np.linspace(0, 999, 20),  # spread over time - passes
+        np.arange(10, 30),  # too early
+        np.arange(900, 920),  # too late
+        np.arange(500, 520),  # mean frame passes, all in one bin
+        [500, 600],  # not clustered
+    )).astype(np.uint32)
+    labels = np.repeat([0, 2, 3, 4, -1], [20, 20, 20, 20, 2]).astype(
+        np.int32
+    )
+    labels = clusterer.frame_analysis(labels, frame)
+    assert (labels[:20] == 0).all()
+    assert (labels[20:] == -1).all()
+
+
+def test_cluster_labels():
+    """
+    Test cluster labels of hand-built localizations with clustering
+    radius of 1 and min_locs of 3
+    """
+
+    x, y = np.array([
+        # two local maxima within radius with tied number of
+        # neighbors, merged into one cluster
+        (0, 0), (0.9, 0), (-0.6, 0), (-0.6, 0.2), (1.5, 0), (1.5, 0.2),
+        # local maxima with tied number of neighbors sharing a
+        # neighbor; not merged, the later one takes the shared neighbor
+        (10, 0), (10.8, 0), (11.6, 0), (9.5, 0), (9.5, 0.1),
+        (12.1, 0), (12.1, 0.1),
+        # cluster losing locs to a later local maximum, removed since
+        # it has fewer than min_locs locs left
+        (20, 0), (20.8, 0), (20.8, 0.1), (19.5, 0),
+        (21.6, 0), (22.2, 0), (22.2, 0.1),
+        # no local maximum
+        (30, 0), (30.1, 0),
+    ]).T
+    expected = np.array([
+        0, 0, 0, 0, 0, 0,
+        2, 3, 3, 2, 2, 3, 3,
+        -1, 5, 5, -1, 5, 5, 5,
+        -1, -1,
+    ])
+    labels = clusterer.cluster_2D(x, y, None, 1.0, 3, False)
+    assert np.array_equal(labels, expected)
+
+    clustered = clusterer.cluster(_locs(x, y), (1.0, 3, None, False, None))
+    assert np.array_equal(clustered.group, expected[expected >= 0])
+    assert np.array_equal(clustered.x, x[expected >= 0].astype(np.float32))
+
+    # 3D, the same merged cluster twice, 0.5 px apart in z
+    x, y = x[:6], y[:6]
+    locs = _locs(
+        np.tile(x, 2), np.tile(y, 2), z=np.repeat([0, 0.5 * 130], 6)
+    )
+    clustered = clusterer.cluster(
+        locs, (1.0, 0.2, 3, None, False, None), pixelsize=130
+    )
+    assert np.array_equal(clustered.group, np.repeat([0, 2], 6))
+    clustered = clusterer.cluster(
+        locs, (1.0, 1.0, 3, None, False, None), pixelsize=130
+    )
+    assert np.array_equal(clustered.group, np.zeros(12))
+
+
+def test_find_cluster_centers_reference():
+    """
+    Test all attributes of cluster centers against cluster_center
+    applied to each cluster separately
+    """
+
+    import pandas as pd
+
+    rng = np.random.default_rng(1)
+    sizes = [2, 3, 4, 10, 25]
+    group = rng.permutation(np.repeat([0, 3, 4, 7, 9], sizes))
+    for three_d in [False, True]:
+        locs = _clustered_locs(group, three_d=three_d, group_input=True)
+        centers = clusterer.find_cluster_centers(locs, pixelsize=130)
+
+        # cluster_center gives the attributes in this order
+        names = [
+            "frame", "std_frame", "x", "y", "std_x", "std_y", "photons",
+            "sx", "sy", "bg", "lpx", "lpy", "ellipticity",
+            "net_gradient", "n",
+        ]
+        if three_d:
+            names += ["z", "std_z", "volume", "convexhull", "group_input"]
+        else:
+            names += ["area", "convexhull", "group_input"]
+        df = pd.DataFrame(locs)
+        for i, g in enumerate(np.unique(group)):
+            expected = clusterer.cluster_center(
+                df[df.group == g], pixelsize=130
+            )
+            assert centers.group[i] == g
+            for name, value in zip(names, expected):
+                assert np.isclose(
+                    centers[name][i], value, rtol=1e-4, atol=0
+                ), (three_d, g, name, centers[name][i], value)